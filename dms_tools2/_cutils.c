@@ -8,27 +8,21 @@
 #include <math.h>
 
 
+// Aligns `r1` and reverse-complemented `r2` as described for
+// `dms_tools2.utils.alignSubamplicon` with `chartype` of codon.
+// Returns new reference to subamplicon string or `False`, or
+// NULL with an exception set on error.
 static PyObject *
-alignSubamplicon(PyObject *self, PyObject *args)
+alignReads(const char *refseq, const char *r1, const char *r2,
+        long refseqstart, long refseqend, double maxmuts, double maxN)
 {
     // define variables
-    const char *refseq, *r1, *r2, *chartype;
-    double maxmuts, maxN;
-    long refseqstart, refseqend, i, j;
+    long i, j;
     long startcodon, nmuts, codonshift;
     char mutnt;
     int hasN, hasmut;
     PyObject *py_subamplicon;
 
-    // parse arguments
-    if (! PyArg_ParseTuple(args, "ssslldds", &refseq, &r1, &r2,
-            &refseqstart, &refseqend, &maxmuts, &maxN, &chartype)) {
-        return NULL;
-    }
-    if (strcmp(chartype, "codon")) {
-        PyErr_SetString(PyExc_ValueError, "chartype not codon");
-        return NULL;
-    }
     long len_subamplicon = refseqend - refseqstart + 1;
     long len_r1 = strlen(r1);
     long len_r2 = strlen(r2);
@@ -67,49 +61,47 @@ alignSubamplicon(PyObject *self, PyObject *args)
         if (subamplicon[i] == 'N') {
             nN++;
             if (nN > maxN) {
+                PyMem_Del(subamplicon);
                 Py_RETURN_FALSE;
             }
         }
     }
 
     // look for excessive mutations
-    if (! strcmp(chartype, "codon")) {
-        switch (refseqstart % 3) {
-            case 1 : startcodon = (refseqstart + 2) / 3;
-                     codonshift = 0;
-                     break;
-            case 2 : startcodon = (refseqstart + 1) / 3 + 1;
-                     codonshift = 2;
-                     break;
-            case 0 : startcodon = refseqstart / 3 + 1;
-                     codonshift = 1;
-                     break;
-            default : PyErr_SetString(PyExc_ValueError, "invalid case");
-                      return NULL;
-        }
-        nmuts = 0;
-        for (i = startcodon; i < (refseqend / 3 + 1); i++) {
-            hasN = 0;
-            hasmut = 0;
-            for (j = 0; j < 3; j++) {
-                mutnt = subamplicon[3 * (i - startcodon) + codonshift + j];
-                if (mutnt == 'N') {
-                    hasN = 1;
-                    break;
-                } else if (mutnt != refseq[3 * i - 3 + j]) {
-                    hasmut = 1;
-                }
+    switch (refseqstart % 3) {
+        case 1 : startcodon = (refseqstart + 2) / 3;
+                 codonshift = 0;
+                 break;
+        case 2 : startcodon = (refseqstart + 1) / 3 + 1;
+                 codonshift = 2;
+                 break;
+        case 0 : startcodon = refseqstart / 3 + 1;
+                 codonshift = 1;
+                 break;
+        default : PyErr_SetString(PyExc_ValueError, "invalid case");
+                  PyMem_Del(subamplicon);
+                  return NULL;
+    }
+    nmuts = 0;
+    for (i = startcodon; i < (refseqend / 3 + 1); i++) {
+        hasN = 0;
+        hasmut = 0;
+        for (j = 0; j < 3; j++) {
+            mutnt = subamplicon[3 * (i - startcodon) + codonshift + j];
+            if (mutnt == 'N') {
+                hasN = 1;
+                break;
+            } else if (mutnt != refseq[3 * i - 3 + j]) {
+                hasmut = 1;
             }
-            if (hasmut && (! hasN)) {
-                nmuts++;
-                if (nmuts > maxmuts) {
-                    Py_RETURN_FALSE;
-                }
+        }
+        if (hasmut && (! hasN)) {
+            nmuts++;
+            if (nmuts > maxmuts) {
+                PyMem_Del(subamplicon);
+                Py_RETURN_FALSE;
             }
         }
-    } else {
-        PyErr_SetString(PyExc_ValueError, "invalid chartype");
-        return NULL;
     }
 
     // return subamplicon
@@ -119,13 +111,130 @@ alignSubamplicon(PyObject *self, PyObject *args)
 }
 
 
+// Fills `rc` (which must have room for `slen + 1` chars) with the
+// reverse complement of `s`. Returns 0 on success, or -1 with an
+// exception set if `s` has an invalid nucleotide.
+static int
+fillReverseComplement(const char *s, size_t slen, char *rc)
+{
+    size_t i;
+
+    rc[slen] = '\0'; // string termination character
+    for (i = 0; i < slen; i++) {
+        switch (s[slen - 1 - i]) {
+            case 'A' : rc[i] = 'T';
+                       break;
+            case 'C' : rc[i] = 'G';
+                       break;
+            case 'G' : rc[i] = 'C';
+                       break;
+            case 'T' : rc[i] = 'A';
+                       break;
+            case 'N' : rc[i] = 'N';
+                       break;
+            default : PyErr_SetString(PyExc_ValueError, "invalid nt");
+                      return -1;
+        }
+    }
+    return 0;
+}
+
+
+static PyObject *
+alignSubamplicon(PyObject *self, PyObject *args)
+{
+    // define variables
+    const char *refseq, *r1, *r2, *chartype;
+    double maxmuts, maxN;
+    long refseqstart, refseqend;
+
+    // parse arguments
+    if (! PyArg_ParseTuple(args, "ssslldds", &refseq, &r1, &r2,
+            &refseqstart, &refseqend, &maxmuts, &maxN, &chartype)) {
+        return NULL;
+    }
+    if (strcmp(chartype, "codon")) {
+        PyErr_SetString(PyExc_ValueError, "chartype not codon");
+        return NULL;
+    }
+    return alignReads(refseq, r1, r2, refseqstart, refseqend,
+            maxmuts, maxN);
+}
+
+
+static PyObject *
+alignSubamplicons(PyObject *self, PyObject *args)
+{
+    // define variables
+    const char *refseq, *chartype, *r1, *r2;
+    double maxmuts, maxN;
+    long refseqstart, refseqend;
+    PyObject *r1s, *r2s, *py_results, *py_aligned;
+    Py_ssize_t nreads, iread, len_r2;
+    char *r2rc;
+
+    // parse arguments
+    if (! PyArg_ParseTuple(args, "sO!O!lldds", &refseq, &PyList_Type, &r1s,
+            &PyList_Type, &r2s, &refseqstart, &refseqend, &maxmuts,
+            &maxN, &chartype)) {
+        return NULL;
+    }
+    if (strcmp(chartype, "codon")) {
+        PyErr_SetString(PyExc_ValueError, "chartype not codon");
+        return NULL;
+    }
+    nreads = PyList_GET_SIZE(r1s);
+    if (nreads != PyList_GET_SIZE(r2s)) {
+        PyErr_SetString(PyExc_ValueError, "r1s and r2s differ in length");
+        return NULL;
+    }
+
+    // align each read pair, reverse complementing r2 first
+    py_results = PyList_New(nreads);
+    if (py_results == NULL) {
+        return NULL;
+    }
+    for (iread = 0; iread < nreads; iread++) {
+        r1 = PyUnicode_AsUTF8(PyList_GET_ITEM(r1s, iread));
+        if (r1 == NULL) {
+            goto error;
+        }
+        r2 = PyUnicode_AsUTF8AndSize(PyList_GET_ITEM(r2s, iread), &len_r2);
+        if (r2 == NULL) {
+            goto error;
+        }
+        r2rc = PyMem_New(char, len_r2 + 1);
+        if (r2rc == NULL) {
+            PyErr_SetString(PyExc_MemoryError, "cannot allocate r2rc");
+            goto error;
+        }
+        if (fillReverseComplement(r2, len_r2, r2rc)) {
+            PyMem_Del(r2rc);
+            goto error;
+        }
+        py_aligned = alignReads(refseq, r1, r2rc, refseqstart, refseqend,
+                maxmuts, maxN);
+        PyMem_Del(r2rc);
+        if (py_aligned == NULL) {
+            goto error;
+        }
+        PyList_SET_ITEM(py_results, iread, py_aligned);
+    }
+    return py_results;
+
+error:
+    Py_DECREF(py_results);
+    return NULL;
+}
+
+
 static PyObject *
 reverseComplement(PyObject *self, PyObject *args)
 {
     // define variables
     PyObject *py_rc;
     const char *s;
-    size_t slen, i;
+    size_t slen;
 
     // parse arguments
     if (! PyArg_ParseTuple(args, "s", &s)) {
@@ -139,22 +248,9 @@ reverseComplement(PyObject *self, PyObject *args)
         PyErr_SetString(PyExc_MemoryError, "cannot allocate rc");
         return NULL;
     }
-    rc[slen] = '\0'; // string termination character
-    for (i = 0; i < slen; i++) {
-        switch (s[slen - 1 - i]) {
-            case 'A' : rc[i] = 'T';
-                       break;
-            case 'C' : rc[i] = 'G';
-                       break;
-            case 'G' : rc[i] = 'C';
-                       break;
-            case 'T' : rc[i] = 'A';
-                       break;
-            case 'N' : rc[i] = 'N';
-                       break;
-            default : PyErr_SetString(PyExc_ValueError, "invalid nt");
-                      return NULL;
-        }
+    if (fillReverseComplement(s, slen, rc)) {
+        PyMem_Del(rc);
+        return NULL;
     }
     py_rc = PyUnicode_FromString(rc);
     PyMem_Del(rc);
@@ -305,6 +401,9 @@ static PyMethodDef cutilsMethods[] = {
             "`r2` should be reverse-complemented prior to call."},
     {"alignSubamplicon", alignSubamplicon, METH_VARARGS,
             "Same as `dms_tools2.utils.alignSubamplicon`."},
+    {"alignSubamplicons", alignSubamplicons, METH_VARARGS,
+            "Same as `dms_tools2.utils.alignSubamplicons` but "
+            "`r1s` and `r2s` must be lists."},
     {"lowQtoN", lowQtoN, METH_VARARGS,
             "Same as `dms_tools2.utils.lowQtoN`."},
     {"reverseComplement", reverseComplement, METH_VARARGS,
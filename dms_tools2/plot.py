@@ -12,11 +12,13 @@ and `seaborn <https://seaborn.pydata.org/index.html>`_.
 
 import re
 import os
+import csv
+import tempfile
 import math
+import functools
 import natsort
 import pandas
 import numpy
-import scipy.stats
 import matplotlib
 matplotlib.use('pdf')
 import matplotlib.pyplot as plt
@@ -115,20 +117,72 @@ def latexSciNot(xlist):
     >>> latexSciNot([0, 1, 2])
     ['$0$', '$1$', '$2$']
     """
-    formatlist = []
-    for x in xlist:
-        xf = "{0:.2g}".format(x)
-        if xf[ : 2] == '1e':
-            xf = "$10^{{{0}}}$".format(int(xf[2 : ]))
-        elif xf[ : 3] == '-1e':
-            xf = "$-10^{{{0}}}$".format(int(xf[3 : ]))
-        elif 'e' in xf:
-            (d, exp) = xf.split('e')
-            xf = '${0} \\times 10^{{{1}}}$'.format(d, int(exp))
-        else:
-            xf = '${0}$'.format(xf)
-        formatlist.append(xf)
-    return formatlist
+    return [_latexSciNotSingle(x) for x in xlist]
+
+
+@functools.lru_cache(maxsize=1024)
+def _latexSciNotSingle(x):
+    """Formats a single number for `latexSciNot`.
+
+    Cached since plotting calls `latexSciNot` repeatedly with
+    the same axis breaks.
+    """
+    xf = "{0:.2g}".format(x)
+    if xf[ : 2] == '1e':
+        xf = "$10^{{{0}}}$".format(int(xf[2 : ]))
+    elif xf[ : 3] == '-1e':
+        xf = "$-10^{{{0}}}$".format(int(xf[3 : ]))
+    elif 'e' in xf:
+        (d, exp) = xf.split('e')
+        xf = '${0} \\times 10^{{{1}}}$'.format(d, int(exp))
+    else:
+        xf = '${0}$'.format(xf)
+    return xf
+
+
+def _annotateCodonCounts(countsfile):
+    """Cached version of `dms_tools2.utils.annotateCodonCounts`.
+
+    Several plotting functions annotate the same counts files, so
+    the annotated data frames are cached. The cache is keyed by the
+    file's modification time in nanoseconds and its size so changed
+    files are re-annotated. The returned data frame is shared, so do
+    not modify it in place.
+    """
+    stat = os.stat(countsfile)
+    return _annotateCodonCountsByStat(os.path.abspath(countsfile),
+            stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=32)
+def _annotateCodonCountsByStat(countsfile, mtime, size):
+    """Does the work for `_annotateCodonCounts`."""
+    return dms_tools2.utils.annotateCodonCounts(countsfile)
+
+
+def _readSingleRowCSV(csvfile):
+    """Reads CSV file with a header and one row of integers.
+
+    Faster than `pandas.read_csv` for the tiny statistics files
+    created by ``dms2_bcsubamp``.
+
+    Args:
+        `csvfile` (str)
+            Name of CSV file.
+
+    Returns:
+        Dict keyed by column names with integer values.
+
+    >>> with tempfile.NamedTemporaryFile(mode='w') as f:
+    ...     dummyvar = f.write('total,fail filter\\n50,3\\n')
+    ...     f.flush()
+    ...     _readSingleRowCSV(f.name) == {'total':50, 'fail filter':3}
+    True
+    """
+    with open(csvfile) as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 1, "{0} does not have one row".format(csvfile)
+    return dict([(key, int(value)) for (key, value) in rows[0].items()])
 
 
 def plotReadStats(names, readstatfiles, plotfile):
@@ -144,8 +198,8 @@ def plotReadStats(names, readstatfiles, plotfile):
     """
     assert len(names) == len(readstatfiles) == len(set(names))
     assert os.path.splitext(plotfile)[1].lower() == '.pdf'
-    readstats = pandas.concat([pandas.read_csv(f).assign(name=name) for
-                (name, f) in zip(names, readstatfiles)], ignore_index=True)
+    readstats = pandas.DataFrame([_readSingleRowCSV(f) for f in
+                readstatfiles]).assign(name=list(names))
     readstats['retained'] = (readstats['total'] - readstats['fail filter']
             - readstats['low Q barcode'])
     readstats_melt = readstats.melt(id_vars='name', 
@@ -177,8 +231,8 @@ def plotBCStats(names, bcstatsfiles, plotfile):
     """
     assert len(names) == len(bcstatsfiles) == len(set(names))
     assert os.path.splitext(plotfile)[1].lower() == '.pdf'
-    bcstats = pandas.concat([pandas.read_csv(f).assign(name=name) for
-                (name, f) in zip(names, bcstatsfiles)], ignore_index=True)
+    bcstats = pandas.DataFrame([_readSingleRowCSV(f) for f in
+                bcstatsfiles]).assign(name=list(names))
     bcstats_melt = bcstats.melt(id_vars='name', 
             value_vars=['too few reads', 'not alignable', 'aligned'],
             value_name='number of barcodes', var_name='barcode fate')
@@ -220,20 +274,18 @@ def plotReadsPerBC(names, readsperbcfiles, plotfile,
     for (name, f) in zip(names, readsperbcfiles):
         df = pandas.read_csv(f)
         # make 'number of reads' maxreads hold number >= maxreads barcodes
-        n_ge = df[df['number of reads'] >= maxreads]['number of reads'].sum()
-        df = df.append(pandas.DataFrame({'number of reads':[maxreads],
-                'number of barcodes':[n_ge]}))
-        for nreads in range(1, maxreads):
-            if nreads not in df['number of reads']:
-                df.append(pandas.DataFrame({'number of reads':[nreads],
-                        'number of barcodes':[0]}))
-        df = df[df['number of reads'] <= maxreads]
-        df = df.assign(name=name)
+        df['number of reads'] = df['number of reads'].clip(upper=maxreads)
+        df = (df.groupby('number of reads')['number of barcodes']
+                .sum()
+                .reindex(range(1, maxreads + 1), fill_value=0)
+                .reset_index()
+                .assign(name=name)
+                )
         dfs.append(df)
-    df = pandas.concat(dfs, ignore_index=True)
+    df = pandas.concat(dfs, ignore_index=True, copy=False)
 
     # make name a category to preserve order
-    df['name'] = df['name'].astype('category', categories=names)
+    df['name'] = pandas.Categorical(df['name'], list(names))
 
     ncol = min(maxcol, len(names))
     nrow = math.ceil(len(names) / float(ncol))
@@ -251,6 +303,43 @@ def plotReadsPerBC(names, readsperbcfiles, plotfile,
     plt.close()
 
 
+def _plotAlongSequence(df, y, names, plotfile, maxcol):
+    """Step plot of a quantity along the sequence for each sample.
+
+    Helper function for `plotDepth` and `plotMutFreq`.
+
+    Args:
+        `df` (`pandas.DataFrame`)
+            Has columns `site`, `name`, and `y`. The `name`
+            column is converted to a category in place.
+        `y` (str)
+            Column in `df` plotted on the y-axis.
+        `names` (list or series)
+            Names of samples in the order they are faceted.
+        `plotfile` (str)
+            Name of created PDF plot file.
+        `maxcol` (int)
+            Number of columns in faceted plot.
+    """
+    ncol = min(maxcol, len(names))
+    nrow = math.ceil(len(names) / float(ncol))
+
+    # make name a category to preserve order
+    df['name'] = pandas.Categorical(df['name'], list(names))
+
+    p = (ggplot(df, aes(x='site', y=y))
+            + geom_step(size=0.4)
+            + scale_y_continuous(labels=latexSciNot, 
+                    limits=(0, df[y].max()))
+            + scale_x_continuous(limits=(df['site'].min(),
+                    df['site'].max()))
+            + facet_wrap('~name', ncol=ncol) 
+            + theme(figure_size=(2.25 * (0.6 + ncol), 1.3 * (0.3 + nrow)))
+            )
+    p.save(plotfile, verbose=False)
+    plt.close()
+
+
 def plotDepth(names, countsfiles, plotfile, maxcol=4, charlist=CODONS):
     """Plot sequencing depth along primary sequence.
 
@@ -272,31 +361,19 @@ def plotDepth(names, countsfiles, plotfile, maxcol=4, charlist=CODONS):
     assert len(names) == len(countsfiles) == len(set(names))
     assert os.path.splitext(plotfile)[1].lower() == '.pdf'
 
+    charlist = list(charlist)
+    # read counts as int32 so all characters form one compact block
     counts = pandas.concat(
-            [pandas.read_csv(f)
+            [pandas.read_csv(f, usecols=['site'] + charlist,
+                    dtype=dict([(c, 'int32') for c in charlist]))
                    .assign(name=name)
-                   .assign(ncounts=lambda x: x[charlist].sum(axis=1))
-                   .rename(columns={'ncounts':'number of counts'})
-            for (name, f) in zip(names, countsfiles)], ignore_index=True)
-    
-    ncol = min(maxcol, len(names))
-    nrow = math.ceil(len(names) / float(ncol))
-
-    # make name a category to preserve order
-    counts['name'] = counts['name'].astype('category', 
-            categories=names)
+            for (name, f) in zip(names, countsfiles)],
+            ignore_index=True, copy=False)
+    # sum all files at once over the array rather than per data frame
+    counts['number of counts'] = counts[charlist].values.sum(axis=1,
+            dtype='int64')
 
-    p = (ggplot(counts, aes(x='site', y='number of counts'))
-            + geom_step(size=0.4)
-            + scale_y_continuous(labels=latexSciNot, 
-                    limits=(0, counts['number of counts'].max()))
-            + scale_x_continuous(limits=(counts['site'].min(),
-                    counts['site'].max()))
-            + facet_wrap('~name', ncol=ncol) 
-            + theme(figure_size=(2.25 * (0.6 + ncol), 1.3 * (0.3 + nrow)))
-            )
-    p.save(plotfile, verbose=False)
-    plt.close()
+    _plotAlongSequence(counts, 'number of counts', names, plotfile, maxcol)
 
 
 def plotMutFreq(names, countsfiles, plotfile, maxcol=4):
@@ -315,28 +392,12 @@ def plotMutFreq(names, countsfiles, plotfile, maxcol=4):
     assert len(names) == len(countsfiles) == len(set(names))
     assert os.path.splitext(plotfile)[1].lower() == '.pdf'
 
-    counts = pandas.concat([dms_tools2.utils.annotateCodonCounts(f).assign(
+    counts = pandas.concat([_annotateCodonCounts(f).assign(
             name=name) for (name, f) in zip(names, countsfiles)], 
-            ignore_index=True).rename(columns={'mutfreq':'mutation frequency'})
+            ignore_index=True, copy=False).rename(
+            columns={'mutfreq':'mutation frequency'})
     
-    ncol = min(maxcol, len(names))
-    nrow = math.ceil(len(names) / float(ncol))
-
-    # make name a category to preserve order
-    counts['name'] = counts['name'].astype('category', 
-            categories=names)
-
-    p = (ggplot(counts, aes(x='site', y='mutation frequency'))
-            + geom_step(size=0.4)
-            + scale_y_continuous(labels=latexSciNot, 
-                    limits=(0, counts['mutation frequency'].max()))
-            + scale_x_continuous(limits=(counts['site'].min(),
-                    counts['site'].max()))
-            + facet_wrap('~name', ncol=ncol) 
-            + theme(figure_size=(2.25 * (0.6 + ncol), 1.3 * (0.3 + nrow)))
-            )
-    p.save(plotfile, verbose=False)
-    plt.close()
+    _plotAlongSequence(counts, 'mutation frequency', names, plotfile, maxcol)
 
 
 def plotCumulMutCounts(names, countsfiles, plotfile, chartype,
@@ -367,41 +428,40 @@ def plotCumulMutCounts(names, countsfiles, plotfile, chartype,
     assert len(names) == len(countsfiles) == len(set(names))
     assert os.path.splitext(plotfile)[1].lower() == '.pdf'
 
-    counts = pandas.concat([pandas.read_csv(f).assign(name=name) for
-            (name, f) in zip(names, countsfiles)], ignore_index=True)
-
     if chartype != 'codon':
         raise ValueError("invalid chartype of {0}".format(chartype))
 
-    codoncounts = pandas.concat([pandas.read_csv(f).assign(name=name)
-            for (name, f) in zip(names, countsfiles)],
-            ignore_index=True).assign(character='codons')
-    assert set(CODONS) <= set(codoncounts.columns)
-    codonmelt = codoncounts.melt(id_vars=['name', 'wildtype', 'character'], 
-            value_vars=CODONS, value_name='counts',
-            var_name='codon')
-    codonmelt = codonmelt[codonmelt['codon'] != codonmelt['wildtype']]
-
-    aacounts = pandas.concat([dms_tools2.utils.codonToAACounts(
-            pandas.read_csv(f)).assign(name=name)
-            for (name, f) in zip(names, countsfiles)],
-            ignore_index=True).assign(character='amino acids')
-    assert set(AAS_WITHSTOP) <= set(aacounts.columns)
-    aamelt = aacounts.melt(id_vars=['name', 'character', 'wildtype'], 
-            value_vars=AAS_WITHSTOP, value_name='counts',
-            var_name='aa')
-    aamelt = aamelt[aamelt['aa'] != aamelt['wildtype']]
-
-    df = pandas.concat([codonmelt, aamelt], ignore_index=True)
+    # read each file once, get counts of all non-wildtype codons and
+    # amino acids at each site without melting the full data frames,
+    # then compute cumulative fraction at each count from 0 to nmax
+    ncounts = numpy.arange(nmax + 1)
+    dfs = []
+    for (name, f) in zip(names, countsfiles):
+        codoncounts = pandas.read_csv(f, usecols=['site', 'wildtype'] +
+                CODONS)
+        aacounts = dms_tools2.utils.codonToAACounts(codoncounts)
+        for (character, counts, chars) in [
+                ('codons', codoncounts, CODONS),
+                ('amino acids', aacounts, AAS_WITHSTOP)]:
+            mutcounts = numpy.sort(_mutCounts(counts, chars))
+            dfs.append(pandas.DataFrame({
+                    'counts':ncounts,
+                    'fraction':numpy.searchsorted(mutcounts, ncounts,
+                            side='right') / float(len(mutcounts)),
+                    'name':name,
+                    'character':character,
+                    }))
+    df = pandas.concat(dfs, ignore_index=True, copy=False)
 
     # make name a category to preserve order
-    df['name'] = df['name'].astype('category', categories=names)
+    df['name'] = pandas.Categorical(df['name'], list(names))
 
     maxcol = 4
     ncol = min(maxcol, len(names))
     nrow = math.ceil(len(names) / float(ncol))
-    p = (ggplot(df, aes('counts', color='character', linestyle='character'))
-            + stat_ecdf(geom='step', size=1)
+    p = (ggplot(df, aes('counts', 'fraction', color='character',
+                linestyle='character'))
+            + geom_step(size=1)
             + scale_x_continuous(limits=(0, nmax))
             + facet_wrap('~name', ncol=ncol) 
             + theme(figure_size=(2.25 * (0.6 + ncol), 1.3 * (0.5 + nrow)),
@@ -415,6 +475,36 @@ def plotCumulMutCounts(names, countsfiles, plotfile, chartype,
     plt.close()
 
 
+def _mutCounts(counts, chars):
+    """Gets counts of all non-wildtype characters at all sites.
+
+    Helper function for `plotCumulMutCounts`.
+
+    Args:
+        `counts` (`pandas.DataFrame`)
+            Has column `wildtype` and a column for each character
+            in `chars`.
+        `chars` (list)
+            All characters, each `wildtype` must be one of these.
+
+    Returns:
+        A `numpy.ndarray` with the counts of every non-wildtype
+        character at every site.
+
+    >>> counts = pandas.DataFrame({'wildtype':['A', 'C'], 'A':[5, 1],
+    ...         'C':[2, 9], 'G':[0, 3]})
+    >>> _mutCounts(counts, ['A', 'C', 'G']).tolist()
+    [2, 0, 1, 3]
+    """
+    assert set(chars) <= set(counts.columns)
+    wtindex = pandas.Categorical(counts['wildtype'], chars).codes
+    assert (wtindex >= 0).all(), "wildtype not in chars"
+    countsmatrix = counts[chars].values
+    ismut = numpy.ones(countsmatrix.shape, dtype='bool')
+    ismut[numpy.arange(len(wtindex)), wtindex] = False
+    return countsmatrix[ismut]
+
+
 def plotCodonMutTypes(names, countsfiles, plotfile,
         classification='aachange', csvfile=None):
     """Plot average frequency codon mutation types.
@@ -443,9 +533,9 @@ def plotCodonMutTypes(names, countsfiles, plotfile,
     assert len(names) == len(countsfiles) == len(set(names))
     assert os.path.splitext(plotfile)[1].lower() == '.pdf'
 
-    counts = pandas.concat([dms_tools2.utils.annotateCodonCounts(f).assign(
+    counts = pandas.concat([_annotateCodonCounts(f).assign(
             name=name) for (name, f) in zip(names, countsfiles)], 
-            ignore_index=True)
+            ignore_index=True, copy=False)
 
     if classification == 'aachange':
         muttypes = {'stop':'nstop', 'synonymous':'nsyn', 
@@ -460,9 +550,10 @@ def plotCodonMutTypes(names, countsfiles, plotfile,
     else:
         raise ValueError("Invalid classification {0}".format(classification))
 
+    # sum each count column over all sites for each sample
     df = (counts[list(muttypes.values()) + ['ncounts', 'name']]
             .groupby('name', as_index=False)
-            .sum(axis=1)
+            .sum()
             .assign(ncounts=lambda x: x['ncounts'].astype('float'))
             )
     for (newcol, n) in muttypes.items():
@@ -493,7 +584,7 @@ def plotCodonMutTypes(names, countsfiles, plotfile,
 
 
 def plotCorrMatrix(names, infiles, plotfile, datatype,
-        trim_unshared=True, title=''):
+        trim_unshared=True, title='', maxpoints=20000):
     """Plots correlations among replicates.
 
     Args:
@@ -517,13 +608,19 @@ def plotCorrMatrix(names, infiles, plotfile, datatype,
             shared among all files. If `False`, raise an error.
         `title` (str)
             Title to place above plot.
+        `maxpoints` (int)
+            If there are more than this many data points, only plot
+            a random subset of this many. Correlations are still
+            computed using all data points.
     """
     assert len(names) == len(infiles) == len(set(names)) > 1
     assert os.path.splitext(plotfile)[1].lower() == '.pdf'
 
     # corr coefficients as here: https://stackoverflow.com/a/30942817
+    # looked up in `corr`, which is computed once from all of `df`
+    # even if we only plot a subset of points
     def corrfunc(x, y, **kws):
-        r, _ = scipy.stats.pearsonr(x, y)
+        r = corr.at[x.name, y.name]
         ax = plt.gca()
         ax.annotate('R = {0:.2f}'.format(r), xy=(0.05, 0.9), 
                 xycoords=ax.transAxes, fontsize=19, 
@@ -534,79 +631,68 @@ def plotCorrMatrix(names, infiles, plotfile, datatype,
         prefs = [pandas.read_csv(f).assign(name=name) for (name, f) 
                 in zip(names, infiles)]
         chars = set(prefs[0].columns)
-        sites = set(prefs[0]['site'].values)
         for p in prefs:
             unsharedchars = chars.symmetric_difference(set(p.columns))
             if unsharedchars:
                 raise ValueError("infiles don't have same characters: {0}"
                         .format(unsharedchars))
-            unsharedsites = sites.symmetric_difference(set(p['site']))
-            if trim_unshared:
-                sites -= unsharedsites
-            elif unsharedsites:
-                raise ValueError("infiles don't have same sites: {0}".
-                        format(unsharedsites))
+        sites = _sharedValues([p['site'] for p in prefs], trim_unshared,
+                'sites')
         assert {'site', 'name'} < chars
         chars = list(chars - {'site', 'name'})
         # get measurements for each replicate in its own column
-        df = (pandas.concat(prefs, ignore_index=True)
-                    .query('site in @sites') # only keep shared sites
+        df = (pandas.concat(prefs, ignore_index=True, copy=False)
+                    [lambda x: x['site'].isin(sites)] # shared sites
                     .melt(id_vars=['name', 'site'], var_name='char')
-                    .pivot_table(index=['site', 'char'], columns='name')
+                    .set_index(['site', 'char', 'name'])
+                    ['value']
+                    .unstack('name')
                     )
-        df.columns = df.columns.get_level_values(1)
 
     elif datatype in ['mutdiffsel', 'mutfracsurvive']:
-        mut_df = [pandas.read_csv(f)
+        mut_df = [pandas.read_csv(f, usecols=['site', 'wildtype',
+                                'mutation', datatype])
                         .assign(name=name)
                         .assign(mutname=lambda x: x.wildtype +
                                 x.site.map(str) + x.mutation)
                         .sort_values('mutname')
                         [['name', 'mutname', datatype]]
                     for (name, f) in zip(names, infiles)]
-        muts = set(mut_df[0]['mutname'].values)
-        for m in mut_df:
-            unsharedmuts = muts.symmetric_difference(set(m['mutname']))
-            if trim_unshared:
-                muts -= unsharedmuts
-            elif unsharedmuts:
-                raise ValueError("infiles don't have same muts: {0}".
-                        format(unsharedmuts))
-        df = (pandas.concat(mut_df, ignore_index=True)
-                    .query('mutname in @muts') # only keep shared muts
-                    .pivot_table(index='mutname', columns='name')
+        muts = _sharedValues([m['mutname'] for m in mut_df], trim_unshared,
+                'muts')
+        df = (pandas.concat(mut_df, ignore_index=True, copy=False)
+                    [lambda x: x['mutname'].isin(muts)] # shared muts
+                    .pivot(index='mutname', columns='name', values=datatype)
                     .dropna()
                     )
-        df.columns = df.columns.get_level_values(1)
 
     elif datatype in ['abs_diffsel', 'positive_diffsel', 'max_diffsel',
             'avgfracsurvive', 'maxfracsurvive']:
-        site_df = [pandas.read_csv(f)
+        site_df = [pandas.read_csv(f, usecols=['site', datatype])
                          .assign(name=name)
                          .sort_values('site')
                          [['name', 'site', datatype]]
                     for (name, f) in zip(names, infiles)]
-        sites = set(site_df[0]['site'].values)
-        for s in site_df:
-            unsharedsites = sites.symmetric_difference(set(s['site']))
-            if trim_unshared:
-                sites -= unsharedsites
-            elif unsharedsites:
-                raise ValueError("infiles don't have same sites: {0}".
-                        format(unsharedsites))
-        df = (pandas.concat(site_df, ignore_index=True)
-                    .query('site in @sites') # only keep shared sites
-                    .pivot_table(index='site', columns='name')
+        sites = _sharedValues([s['site'] for s in site_df], trim_unshared,
+                'sites')
+        df = (pandas.concat(site_df, ignore_index=True, copy=False)
+                    [lambda x: x['site'].isin(sites)] # shared sites
+                    .pivot(index='site', columns='name', values=datatype)
                     .dropna()
                     )
-        df.columns = df.columns.get_level_values(1)
 
     else:
         raise ValueError("Invalid datatype {0}".format(datatype))
 
+    corr = df.corr(method='pearson')
+
     # map lower / upper / diagonal as here:
     # https://stackoverflow.com/a/30942817 for plot
-    p = seaborn.PairGrid(df)
+    if len(df) > maxpoints:
+        plotdf = df.sample(n=maxpoints, random_state=1)
+    else:
+        plotdf = df
+    p = seaborn.PairGrid(plotdf)
     p.map_lower(plt.scatter, s=22, alpha=0.35, color='black', 
             marker='o', edgecolor='none', rasterized=True)
     p.map_lower(corrfunc)
@@ -651,6 +737,41 @@ def plotCorrMatrix(names, infiles, plotfile, datatype,
     plt.close()
 
 
+def _sharedValues(valuelists, trim_unshared, description):
+    """Gets values shared among all lists in `valuelists`.
+
+    Helper function for `plotCorrMatrix`.
+
+    Args:
+        `valuelists` (list)
+            List of lists or series of values (e.g., sites).
+        `trim_unshared` (bool)
+            If `False`, raise an error if not all lists have same values.
+        `description` (str)
+            Description of values used in error message.
+
+    Returns:
+        The set of values found in all lists in `valuelists`.
+
+    >>> sorted(_sharedValues([[1, 2, 3], [2, 3, 4], [3, 2]], True, 'sites'))
+    [2, 3]
+    >>> _sharedValues([[1, 2], [2, 1]], False, 'sites') == {1, 2}
+    True
+    >>> _sharedValues([[1, 2], [2, 3]], False, 'sites')
+    Traceback (most recent call last):
+        ...
+    ValueError: infiles don't have same sites: {1, 3}
+    """
+    valuesets = [set(values) for values in valuelists]
+    shared = set.intersection(*valuesets)
+    if not trim_unshared:
+        unshared = set.union(*valuesets) - shared
+        if unshared:
+            raise ValueError("infiles don't have same {0}: {1}".format(
+                    description, unshared))
+    return shared
+
+
 def plotSiteDiffSel(names, diffselfiles, plotfile, 
         diffseltype, maxcol=2):
     """Plot site diffsel or fracsurvive along sequence.
@@ -682,9 +803,10 @@ def plotSiteDiffSel(names, diffselfiles, plotfile,
 
     diffsels = [pandas.read_csv(f).assign(name=name) for (name, f) 
             in zip(names, diffselfiles)]
-    assert all([set(diffsels[0]['site']) == set(df['site']) for df in 
-            diffsels]), "diffselfiles not all for same sites"
-    diffsel = pandas.concat(diffsels, ignore_index=True)
+    uniquesites = numpy.unique(diffsels[0]['site'].values)
+    assert all([numpy.array_equal(uniquesites, numpy.unique(df['site'].values))
+            for df in diffsels[1 : ]]), "diffselfiles not all for same sites"
+    diffsel = pandas.concat(diffsels, ignore_index=True, copy=False)
 
     ylabel = 'differential selection'
     if diffseltype == 'positive':
@@ -708,21 +830,19 @@ def plotSiteDiffSel(names, diffselfiles, plotfile,
                             value_name='diffsel',
                             var_name='direction')
                       )
-    # natural sort by site: https://stackoverflow.com/a/29582718
-    diffsel = diffsel.reindex(index=natsort.order_by_index(
-            diffsel.index, natsort.index_natsorted(diffsel.site,
-            signed=True)))
-    # now some manipulations to make site str while siteindex is int
+    # make site str while siteindex is int giving natural sort order,
+    # natural sorting just the unique sites rather than every row
     diffsel['site'] = diffsel['site'].apply(str)
-    diffsel['siteindex'] = pandas.Categorical(diffsel['site'],
-            diffsel['site'].unique()).codes
+    sites = natsort.natsorted(diffsel['site'].unique(),
+            alg=natsort.ns.SIGNED)
+    diffsel['siteindex'] = pandas.Categorical(diffsel['site'], sites).codes
+    diffsel = diffsel.sort_values('siteindex', kind='mergesort')
     
     ncol = min(maxcol, len(names))
     nrow = math.ceil(len(names) / float(ncol))
 
     # make name a category to preserve order
-    diffsel['name'] = diffsel['name'].astype('category', 
-            categories=names)
+    diffsel['name'] = pandas.Categorical(diffsel['name'], list(names))
 
     (xbreaks, xlabels) = breaksAndLabels(diffsel['siteindex'].unique(), 
             diffsel['site'].unique(), n=6)
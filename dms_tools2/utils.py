@@ -7,25 +7,112 @@ Miscellaneous utilities for ``dms_tools2``.
 """
 
 
+import io
 import os
+import csv
 import sys
+import gzip
+import shutil
+import subprocess
 import time
+import functools
+import concurrent.futures
+import itertools
 import platform
 import importlib
 import logging
 import tempfile
 import numpy
 import pandas
-import HTSeq
 import dms_tools2
 import dms_tools2._cutils
 
 
+def _codonPairTables():
+    """Tables classifying mutations between pairs of codons.
+
+    Returns:
+        The 3-tuple `(ntchanges, nntdiff, ntchangeid)`. `ntchanges` lists
+        the nucleotide changes (e.g., ``AtoC``). `nntdiff[i, j]` is the
+        number of nucleotides that differ between `dms_tools2.CODONS[i]`
+        and `dms_tools2.CODONS[j]`. `ntchangeid[i, j]` is the index in
+        `ntchanges` of the change if they differ at exactly one
+        nucleotide, and -1 otherwise.
+
+    >>> (ntchanges, nntdiff, ntchangeid) = _codonPairTables()
+    >>> (i, j) = (dms_tools2.CODONS.index('ATG'),
+    ...         dms_tools2.CODONS.index('ACG'))
+    >>> int(nntdiff[i, j]) == 1 and ntchanges[ntchangeid[i, j]] == 'TtoC'
+    True
+    >>> int(nntdiff[i, i]), int(ntchangeid[i, i])
+    (0, -1)
+    """
+    ntchanges = ['{0}to{1}'.format(nt1, nt2) for nt1 in dms_tools2.NTS
+            for nt2 in dms_tools2.NTS if nt1 != nt2]
+    ncodons = len(dms_tools2.CODONS)
+    nntdiff = numpy.zeros((ncodons, ncodons), dtype='int8')
+    ntchangeid = numpy.full((ncodons, ncodons), -1, dtype='int8')
+    for (i, wt) in enumerate(dms_tools2.CODONS):
+        for (j, c) in enumerate(dms_tools2.CODONS):
+            ntdiffs = ['{0}to{1}'.format(nt1, nt2) for (nt1, nt2)
+                    in zip(wt, c) if nt1 != nt2]
+            nntdiff[i, j] = len(ntdiffs)
+            if len(ntdiffs) == 1:
+                ntchangeid[i, j] = ntchanges.index(ntdiffs[0])
+    return (ntchanges, nntdiff, ntchangeid)
+
+(_NTCHANGES, _NNT_DIFF, _NT_CHANGE_ID) = _codonPairTables()
+
+#: amino acid encoded by each codon in `dms_tools2.CODONS`
+_CODON_AAS = numpy.array([dms_tools2.CODON_TO_AA[c] for c in
+        dms_tools2.CODONS])
+
+#: is each codon in `dms_tools2.CODONS` a stop codon?
+_CODON_ISSTOP = _CODON_AAS == '*'
+
+#: `bytes.translate` table complementing the nucleotides in
+#: `dms_tools2.NTCOMPLEMENT`, and the bytes that are not such nucleotides
+_NTCOMPLEMENT_TABLE = bytes.maketrans(
+        ''.join(dms_tools2.NTCOMPLEMENT.keys()).encode('ascii'),
+        ''.join(dms_tools2.NTCOMPLEMENT.values()).encode('ascii'))
+_NOT_NTS = bytes(sorted(set(range(256)) -
+        set(''.join(dms_tools2.NTCOMPLEMENT).encode('ascii'))))
+
+#: maps `refseqstart % 3` to `(codonoffset, codonshift)` such that the
+#: first full codon in a sequence starting at nucleotide `refseqstart`
+#: (1, 2, ... numbering) is codon `refseqstart // 3 + codonoffset`
+#: (1, 2, ... numbering) and begins `codonshift` nucleotides in
+_CODON_SHIFT_TABLE = {0:(1, 1), 1:(1, 0), 2:(2, 2)}
+
+#: indicator matrix, element `[i, j]` is 1 if `dms_tools2.CODONS[i]`
+#: encodes `dms_tools2.AAS_WITHSTOP[j]` and 0 otherwise
+_CODON_TO_AA_MATRIX = (_CODON_AAS[:, None] ==
+        numpy.array(dms_tools2.AAS_WITHSTOP)).astype('int')
+
+#: site values that `renumberSites` treats as dropped sites
+_DROPPED_SITES = frozenset(['', 'NaN', 'nan', 'None'])
+
+#: buffer size in bytes for files read and written by `renumberSites`
+_RENUMBER_BUFSIZE = 1 << 20
+
+
 def sessionInfo():
     """Returns string with information about session / packages."""
-    s = [
+    return '\n'.join([
             'Version information:',
             '\tTime and date: {0}'.format(time.asctime()),
+            _versionInfo(),
+            ])
+
+
+@functools.lru_cache(maxsize=1)
+def _versionInfo():
+    """Platform and package versions for `sessionInfo`.
+
+    These do not change during a session, so they are cached to avoid
+    repeating the imports and platform queries on every call.
+    """
+    s = [
             '\tPlatform: {0}'.format(platform.platform()),
             '\tPython version: {0}'.format(
                     sys.version.replace('\n', ' ')),
@@ -97,7 +184,8 @@ def initLogger(logfile, prog, args):
         return logger
 
 
-def iteratePairedFASTQ(r1files, r2files, r1trim=None, r2trim=None):
+def iteratePairedFASTQ(r1files, r2files, r1trim=None, r2trim=None,
+        nthreads=1, return_bytes=False):
     """Iterates over FASTQ file pairs for paired-end sequencing reads.
 
     Args:
@@ -110,15 +198,27 @@ def iteratePairedFASTQ(r1files, r2files, r1trim=None, r2trim=None):
             If not `None`, trim `r1` and `q1` to be no longer than this.
         `r2trim` (int or `None`)
             Like `r1trim` but for R2.
+        `nthreads` (int)
+            If > 1, gzipped files are decompressed by ``pigz`` or
+            ``gzip`` in separate processes that run in parallel with
+            the parsing. Only worthwhile for large files. The R1 and
+            R2 files each have their own decompression process, each
+            using up to `nthreads` threads with ``pigz``, so up to
+            2 * `nthreads` threads run in total.
+        `return_bytes` (bool)
+            Return `r1`, `r2`, `q1`, and `q2` as `bytes` rather
+            than `str`, which avoids decoding them.
 
     Returns:
         Each iteration returns `(name, r1, r2, q1, q2, fail)` where:
 
             - `name` is a string giving the read name
 
-            - `r1` and `r2` are strings giving the reads
+            - `r1` and `r2` are strings giving the reads, or
+              `bytes` if `return_bytes` is `True`
 
-            - `q1` and `q2` are strings giving the PHRED Q scores
+            - `q1` and `q2` are strings giving the PHRED Q scores,
+              or `bytes` if `return_bytes` is `True`
 
             - `fail` is `True` if either read failed Illumina chastity
               filter, `False` if both passed, `None` if info not present.
@@ -165,10 +265,9 @@ def iteratePairedFASTQ(r1files, r2files, r1trim=None, r2trim=None):
     assert len(r1files) == len(r2files) > 0
     assert isinstance(r1files, list) and isinstance(r2files, list)
     for (r1file, r2file) in zip(r1files, r2files):
-        r1reader = HTSeq.FastqReader(r1file, raw_iterator=True)
-        r2reader = HTSeq.FastqReader(r2file, raw_iterator=True)
-        for ((r1, id1, q1, qs1), (r2, id2, q2, qs2)) in zip(
-                r1reader, r2reader):
+        for ((id1, r1, q1), (id2, r2, q2)) in zip(
+                _iterateFASTQ(r1file, nthreads, return_bytes),
+                _iterateFASTQ(r2file, nthreads, return_bytes)):
             id1 = id1.split()
             id2 = id2.split()
             name1 = id1[0]
@@ -198,13 +297,120 @@ def iteratePairedFASTQ(r1files, r2files, r1trim=None, r2trim=None):
             yield (name1, r1, r2, q1, q2, fail)
 
 
+def iteratePairedFASTQBatched(r1files, r2files, r1trim=None, r2trim=None,
+        nthreads=1, batchsize=4096, return_bytes=False):
+    """Like `iteratePairedFASTQ` but returns reads in batches.
+
+    Args:
+        `r1files`, `r2files`, `r1trim`, `r2trim`, `nthreads`, `return_bytes`
+            Same meaning as for `iteratePairedFASTQ`.
+        `batchsize` (int)
+            Maximum number of read pairs in each batch.
+
+    Returns:
+        Each iteration returns `(names, r1s, r2s, q1s, q2s, fails)`,
+        where these are tuples holding the entries that
+        `iteratePairedFASTQ` returns for up to `batchsize`
+        consecutive read pairs. The reads and Q scores in `r1s`,
+        `r2s`, `q1s`, and `q2s` are `bytes` if `return_bytes` is
+        `True`, and strings otherwise.
+
+    >>> r1 = ['@read{0} 1:N:0:1\\nAC{0}\\n+\\nII{0}'.format(i)
+    ...         for i in range(5)]
+    >>> r2 = ['@read{0} 2:N:0:1\\nGT{0}\\n+\\nII{0}'.format(i)
+    ...         for i in range(5)]
+    >>> tf = tempfile.NamedTemporaryFile
+    >>> with tf(mode='w') as r1file, tf(mode='w') as r2file:
+    ...     dummyvar = r1file.write('\\n'.join(r1))
+    ...     r1file.flush()
+    ...     dummyvar = r2file.write('\\n'.join(r2))
+    ...     r2file.flush()
+    ...     batches = list(iteratePairedFASTQBatched(r1file.name,
+    ...             r2file.name, batchsize=2))
+    >>> [len(names) for (names, r1s, r2s, q1s, q2s, fails) in batches]
+    [2, 2, 1]
+    >>> batches[-1]
+    (('read4',), ('AC4',), ('GT4',), ('II4',), ('II4',), (False,))
+    """
+    assert batchsize > 0
+    itr = iteratePairedFASTQ(r1files, r2files, r1trim, r2trim, nthreads,
+            return_bytes)
+    while True:
+        batch = list(itertools.islice(itr, batchsize))
+        if not batch:
+            break
+        yield tuple(zip(*batch))
+
+
+def _iterateFASTQ(fastqfile, nthreads=1, return_bytes=False):
+    """Iterates over the reads in a FASTQ file.
+
+    Args:
+        `fastqfile` (str)
+            Name of FASTQ file, gzipped if it ends in ``.gz``.
+        `nthreads` (int)
+            If > 1, decompress gzipped files in a separate ``pigz``
+            (using `nthreads` threads) or ``gzip`` process when one
+            of these programs is available. Each call starts its own
+            process, so paired R1 and R2 files use two of them.
+        `return_bytes` (bool)
+            Return `seq` and `qual` as `bytes` rather than `str`.
+
+    Returns:
+        Each iteration returns `(header, seq, qual)` where `header` is
+        the header line (as `str`) without the leading ``@``.
+    """
+    if return_bytes:
+        (mode, at, plussign) = ('rb', b'@', b'+')
+    else:
+        (mode, at, plussign) = ('rt', '@', '+')
+    proc = None
+    if fastqfile.endswith('.gz'):
+        pigz = shutil.which('pigz')
+        gunzip = pigz or shutil.which('gzip')
+        if nthreads > 1 and gunzip:
+            # pigz applies options only to files named after them
+            if pigz:
+                cmd = [pigz, '-p', str(nthreads), '-dc', fastqfile]
+            else:
+                cmd = [gunzip, '-dc', fastqfile]
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+            if return_bytes:
+                f = proc.stdout
+            else:
+                f = io.TextIOWrapper(proc.stdout)
+        elif return_bytes:
+            # GzipFile iterates lines slowly unless buffered
+            f = io.BufferedReader(gzip.open(fastqfile, 'rb'))
+        else:
+            f = gzip.open(fastqfile, 'rt')
+    else:
+        f = open(fastqfile, mode)
+    try:
+        # zipping the file with itself reads four lines per record
+        for (header, seq, plus, qual) in zip(f, f, f, f):
+            if header[ : 1] != at or plus[ : 1] != plussign:
+                raise ValueError("Invalid FASTQ record in {0}:\n{1}"
+                        .format(fastqfile, header))
+            header = header[1 : ].rstrip()
+            if return_bytes:
+                header = header.decode('ascii')
+            yield (header, seq.rstrip(), qual.rstrip())
+    finally:
+        f.close()
+        if proc is not None:
+            proc.wait()
+    if proc is not None and proc.returncode != 0:
+        raise IOError("Failed to decompress {0}".format(fastqfile))
+
+
 def lowQtoN(r, q, minq, use_cutils=True):
     """Replaces low quality nucleotides with ``N`` characters.
 
     Args:
-        `r` (str)
+        `r` (str or bytes)
             A string representing a sequencing read.
-        `q` (str)
+        `q` (str or bytes)
             String of same length as `r` holding Q scores
             in Sanger ASCII encoding.
         `minq` (length-one string)
@@ -213,20 +419,32 @@ def lowQtoN(r, q, minq, use_cutils=True):
             Use the faster implementation in the `_cutils` module.
 
     Returns:
-        A version of `r` where all positions `i` where 
-        `q[i] < minq` have been replaced with ``N``.
+        A version of `r` (of the same type) where all positions `i`
+        where `q[i] < minq` have been replaced with ``N``.
 
     >>> r = 'ATGCAT'
     >>> q = 'GB<.0+'
     >>> minq = '0'
     >>> lowQtoN(r, q, minq) == 'ATGNAN'
     True
+    >>> lowQtoN(r, q, minq, use_cutils=False) == 'ATGNAN'
+    True
+    >>> lowQtoN(b'ATGCAT', b'GB<.0+', minq) == b'ATGNAN'
+    True
     """
-    if use_cutils:
+    asbytes = isinstance(r, bytes)
+    if use_cutils and not asbytes:
         return dms_tools2._cutils.lowQtoN(r, q, minq)
     assert len(r) == len(q)
-    return ''.join([ri if qi >= minq else 'N'
-            for (ri, qi) in zip(r, q)])
+    if not asbytes:
+        r = r.encode('ascii')
+        q = q.encode('ascii')
+    newr = numpy.where(numpy.frombuffer(q, dtype='uint8') >= ord(minq),
+            numpy.frombuffer(r, dtype='uint8'), numpy.uint8(ord('N'))
+            ).tobytes()
+    if asbytes:
+        return newr
+    return newr.decode('ascii')
 
 
 def buildReadConsensus(reads, minreads, minconcur, use_cutils=True):
@@ -262,33 +480,29 @@ def buildReadConsensus(reads, minreads, minconcur, use_cutils=True):
     >>> reads.append('CTGCATAT')
     >>> buildReadConsensus(reads, 2, 0.75) == 'NTGCATAT'
     True
+    >>> buildReadConsensus(reads, 2, 0.75, use_cutils=False) == 'NTGCATAT'
+    True
     """
     if use_cutils:
         return dms_tools2._cutils.buildReadConsensus(reads, 
                 minreads, minconcur)
-    readlens = list(map(len, reads))
-    maxlen = max(readlens)
-    consensus = []
-    for i in range(maxlen):
-        counts = {}
-        for (r, lenr) in zip(reads, readlens):
-            if lenr > i:
-                x = r[i]
-                if x != 'N':
-                    if x in counts:
-                        counts[x] += 1
-                    else:
-                        counts[x] = 1
-        ntot = sum(counts.values())
-        if ntot < minreads:
-            consensus.append('N')
-        else:
-            (nmax, xmax) = sorted([(n, x) for (x, n) in counts.items()])[-1]
-            if nmax / float(ntot) >= minconcur:
-                consensus.append(xmax)
-            else:
-                consensus.append('N')
-    return ''.join(consensus)
+    maxlen = max(map(len, reads))
+    # array of characters (as bytes) with reads as rows, padded with N
+    chars = numpy.frombuffer(''.join([r.ljust(maxlen, 'N') for r in reads]
+            ).encode('ascii'), dtype='uint8').reshape(len(reads), maxlen)
+    # counts[j, i] is number of reads with character alphabet[j] at site i
+    alphabet = numpy.setdiff1d(chars, numpy.uint8(ord('N')))
+    if not len(alphabet):
+        return 'N' * maxlen
+    counts = (chars == alphabet[:, None, None]).sum(axis=1)
+    ntot = counts.sum(axis=0)
+    nmax = counts.max(axis=0)
+    # on ties take the last character, as sorting (n, x) tuples does
+    xmax = alphabet[len(alphabet) - 1 - counts[::-1].argmax(axis=0)]
+    called = ((ntot > 0) & (ntot >= minreads) &
+            (nmax / numpy.maximum(ntot, 1).astype('float') >= minconcur))
+    return numpy.where(called, xmax, ord('N')).astype('uint8'
+            ).tobytes().decode('ascii')
 
 
 def reverseComplement(s, use_cutils=True):
@@ -306,10 +520,15 @@ def reverseComplement(s, use_cutils=True):
     >>> s = 'ATGCAAN'
     >>> reverseComplement(s) == 'NTTGCAT'
     True
+    >>> reverseComplement(s, use_cutils=False) == 'NTTGCAT'
+    True
     """
     if use_cutils:
         return dms_tools2._cutils.reverseComplement(s)
-    return ''.join(reversed([dms_tools2.NTCOMPLEMENT[nt] for nt in s]))
+    rc = s.encode('ascii').translate(_NTCOMPLEMENT_TABLE, _NOT_NTS)[::-1]
+    if len(rc) != len(s):
+        raise ValueError("invalid nt in {0}".format(s))
+    return rc.decode('ascii')
 
 
 def alignSubamplicon(refseq, r1, r2, refseqstart, refseqend, maxmuts,
@@ -403,57 +622,80 @@ def alignSubamplicon(refseq, r1, r2, refseqstart, refseqend, maxmuts,
         assert len(refseq) % 3 == 0, "refseq length not divisible by 3"
 
     len_subamplicon = refseqend - refseqstart + 1
-    len_r1 = len(r1)
     len_subamplicon_minus_len_r2 = len_subamplicon - len(r2)
-    subamplicon = []
-    for i in range(len_subamplicon):
-        if i < len_subamplicon_minus_len_r2: # site not in r2
-            if i < len_r1: # site in r1
-                subamplicon.append(r1[i])
-            else: # site not in r1
-                subamplicon.append('N')
-        else: # site in r2
-            if i < len_r1: # site in r1
-                r1i = r1[i]
-                r2i = r2[i - len_subamplicon_minus_len_r2]
-                if r1i == r2i:
-                    subamplicon.append(r1i)
-                elif r1i == 'N':
-                    subamplicon.append(r2i)
-                elif r2i == 'N':
-                    subamplicon.append(r1i)
-                else:
-                    subamplicon.append('N')
-            else: # site not in r1
-                subamplicon.append(r2[i - len_subamplicon_minus_len_r2])
-    subamplicon = ''.join(subamplicon)
-
-    if subamplicon.count('N') > maxN:
+    nt_N = numpy.uint8(ord('N'))
+    # fill with r1, then merge in r2 over the sites that it covers
+    subamplicon = numpy.full(len_subamplicon, nt_N, dtype='uint8')
+    r1 = numpy.frombuffer(r1.encode('ascii'), dtype='uint8')[
+            : len_subamplicon]
+    subamplicon[ : len(r1)] = r1
+    r2start = max(0, len_subamplicon_minus_len_r2)
+    r2 = numpy.frombuffer(r2.encode('ascii'), dtype='uint8')[
+            r2start - len_subamplicon_minus_len_r2 : ]
+    r1 = subamplicon[r2start : ]
+    subamplicon[r2start : ] = numpy.where(r1 == r2, r1,
+            numpy.where(r1 == nt_N, r2,
+            numpy.where(r2 == nt_N, r1, nt_N)))
+
+    if (subamplicon == nt_N).sum() > maxN:
         return False
 
     if chartype == 'codon':
-        if refseqstart % 3 == 1:
-            startcodon = (refseqstart + 2) // 3
-            codonshift = 0
-        elif refseqstart % 3 == 2:
-            startcodon = (refseqstart + 1) // 3 + 1
-            codonshift = 2
-        elif refseqstart % 3 == 0:
-            startcodon = refseqstart // 3 + 1
-            codonshift = 1
-        nmuts = 0
-        for icodon in range(startcodon, refseqend // 3 + 1):
-            mutcodon = subamplicon[3 * (icodon - startcodon) + codonshift : 
-                    3 * (icodon - startcodon) + 3 + codonshift]
-            if ('N' not in mutcodon) and (mutcodon != 
-                    refseq[3 * icodon - 3 : 3 * icodon]):
-                nmuts += 1
-                if nmuts > maxmuts:
-                    return False
+        (codonoffset, codonshift) = _CODON_SHIFT_TABLE[refseqstart % 3]
+        startcodon = refseqstart // 3 + codonoffset
+        ncodons = max(0, refseqend // 3 + 1 - startcodon)
+        # compare full codons as rows of nucleotide arrays
+        mutcodons = subamplicon[codonshift : codonshift + 3 * ncodons
+                ].reshape(ncodons, 3)
+        refcodons = numpy.frombuffer(refseq[3 * startcodon - 3 : 3 *
+                (startcodon + ncodons - 1)].encode('ascii'), dtype='uint8'
+                ).reshape(ncodons, 3)
+        nmuts = ((mutcodons != refcodons).any(axis=1) &
+                (mutcodons != nt_N).all(axis=1)).sum()
+        if nmuts > maxmuts:
+            return False
     else:
         raise ValueError("Invalid chartype")
 
-    return subamplicon
+    return subamplicon.tobytes().decode('ascii')
+
+
+def alignSubamplicons(refseq, r1s, r2s, refseqstart, refseqend, maxmuts,
+        maxN, chartype, use_cutils=True):
+    """Like `alignSubamplicon` for many read pairs at the same location.
+
+    Aligning a batch of reads with one call avoids the per-read
+    overhead of calling `alignSubamplicon` from Python.
+
+    Args:
+        `r1s` (list)
+            List of forward reads, each as for `r1` in `alignSubamplicon`.
+        `r2s` (list)
+            List of reverse reads, each as for `r2` in `alignSubamplicon`.
+        `refseq`, `refseqstart`, `refseqend`, `maxmuts`, `maxN`, `chartype`
+            Same meaning as for `alignSubamplicon`.
+        `use_cutils` (bool)
+            Use the faster implementation in the `_cutils` module.
+
+    Returns:
+        List giving the result of `alignSubamplicon` for each read pair.
+
+    >>> refseq = 'ATGGGGAAA'
+    >>> r1s = ['GGGGAA', 'GGGGAT', 'GGGCTA']
+    >>> r2s = ['TTTCCC', 'TATCCC', 'TTAGCC']
+    >>> alignSubamplicons(refseq, r1s, r2s, 3, 9, 1, 0, 'codon')
+    ['GGGGAAA', 'GGGGATA', False]
+    >>> alignSubamplicons(refseq, r1s, r2s, 3, 9, 1, 0, 'codon',
+    ...         use_cutils=False)
+    ['GGGGAAA', 'GGGGATA', False]
+    """
+    assert len(r1s) == len(r2s), "r1s and r2s differ in length"
+    if use_cutils:
+        return dms_tools2._cutils.alignSubamplicons(refseq, list(r1s),
+                list(r2s), refseqstart, refseqend, maxmuts, maxN, chartype)
+    return [alignSubamplicon(refseq, r1, r2, refseqstart, refseqend,
+            maxmuts, maxN, chartype, use_cutils=False)
+            for (r1, r2) in zip(r1s, r2s)]
 
 
 def incrementCounts(refseqstart, subamplicon, chartype, counts):
@@ -506,15 +748,8 @@ def incrementCounts(refseqstart, subamplicon, chartype, counts):
     True
     """
     if chartype == 'codon':
-        if refseqstart % 3 == 1:
-            startcodon = (refseqstart + 2) // 3 - 1
-            codonshift = 0
-        elif refseqstart % 3 == 2:
-            startcodon = (refseqstart + 1) // 3 
-            codonshift = 2
-        elif refseqstart % 3 == 0:
-            startcodon = refseqstart // 3 
-            codonshift = 1
+        (codonoffset, codonshift) = _CODON_SHIFT_TABLE[refseqstart % 3]
+        startcodon = refseqstart // 3 + codonoffset - 1
     else:
         raise ValueError("Invalid chartype")
 
@@ -525,7 +760,7 @@ def incrementCounts(refseqstart, subamplicon, chartype, counts):
             counts[codon][startcodon + i] += 1
 
 
-def codonToAACounts(counts):
+def codonToAACounts(counts, nthreads=1):
     """Makes amino-acid counts `pandas.DataFrame` from codon counts.
 
     Args:
@@ -533,6 +768,9 @@ def codonToAACounts(counts):
             Columns are the string `site` `wildtype` and all codons
             in `dms_tools2.CODONS`. Additional columns are allowed
             but ignored.
+        `nthreads` (int)
+            Process sites in this many chunks in parallel threads. Only
+            worthwhile for many (say > 10,000) sites.
 
     Returns:
         `aacounts` (`pandas.DataFrame`)
@@ -563,19 +801,17 @@ def codonToAACounts(counts):
     >>> all(aacounts['V'] == [0, 0])
     True
     """
-    d = dict([(key, []) for key in ['site', 'wildtype'] + 
-            dms_tools2.AAS_WITHSTOP])
-    for (i, row) in counts.iterrows():
-        d['site'].append(row['site'])
-        d['wildtype'].append(dms_tools2.CODON_TO_AA[row['wildtype']])
-        for aa in dms_tools2.AAS_WITHSTOP:
-            d[aa].append(0)
-        for c in dms_tools2.CODONS:
-            d[dms_tools2.CODON_TO_AA[c]][-1] += (row[c])
-    return pandas.DataFrame(d)
-
-
-def annotateCodonCounts(counts):
+    aacounts = pandas.DataFrame(numpy.concatenate(_mapRowChunks(
+            lambda c: c.dot(_CODON_TO_AA_MATRIX),
+            [counts[dms_tools2.CODONS].values], nthreads)),
+            columns=dms_tools2.AAS_WITHSTOP)
+    aacounts.insert(0, 'wildtype',
+            counts['wildtype'].map(dms_tools2.CODON_TO_AA).values)
+    aacounts.insert(0, 'site', counts['site'].values)
+    return aacounts
+
+
+def annotateCodonCounts(counts, nthreads=1):
     """Gets annotated `pandas.DataFrame` from codon counts.
 
     Some of the programs (e.g., `dms2_bcsubamplicons`) create 
@@ -590,6 +826,9 @@ def annotateCodonCounts(counts):
         `counts` (str)
             Name of existing codon counts CSV file, or `pandas.DataFrame`
             holding counts.
+        `nthreads` (int)
+            Process sites in this many chunks in parallel threads. Only
+            worthwhile for many (say > 10,000) sites.
 
     Returns:
         `df` (`pandas.DataFrame`)
@@ -664,58 +903,115 @@ def annotateCodonCounts(counts):
     assert set(dms_tools2.CODONS) <= set(df.columns), \
             "Did not find counts for all codons".format(counts)
 
-    df['ncounts'] = df[dms_tools2.CODONS].sum(axis=1)
+    wtindex = pandas.Categorical(df['wildtype'], dms_tools2.CODONS).codes
+    assert (wtindex >= 0).all(), "invalid wildtype codon"
+    chunks = _mapRowChunks(_annotateCodonCountsChunk,
+            [df[dms_tools2.CODONS].values, wtindex], nthreads)
+    for (i, (col, _)) in enumerate(chunks[0]):
+        df[col] = numpy.concatenate([chunk[i][1] for chunk in chunks])
 
-    df['mutfreq'] = (((df['ncounts'] - df.lookup(df['wildtype'].index,
-            df['wildtype'].values)) / df['ncounts'].astype('float'))
-            .fillna(0))
+    return df
 
-    ntchanges = ['{0}to{1}'.format(nt1, nt2) for nt1 in dms_tools2.NTS
-            for nt2 in dms_tools2.NTS if nt1 != nt2]
 
-    nstoplist = []
-    nsynlist = []
-    nnonsynlist = []
-    nXntlists = dict([(n + 1, []) for n in range(3)])
-    nntchangeslists = dict([(ntchange, []) for ntchange in ntchanges])
-    for (i, row) in df.iterrows():
-        nstop = nsyn = nnonsyn = 0
-        nXnt = dict([(n + 1, 0) for n in range(3)])
-        nntchanges = dict([(ntchange, 0) for ntchange in ntchanges])
-        wt = row['wildtype']
-        wtaa = dms_tools2.CODON_TO_AA[wt]
-        for c in dms_tools2.CODONS:
-            if c == wt:
-                continue
-            aa = dms_tools2.CODON_TO_AA[c]
-            if aa == '*':
-                nstop += row[c]
-            elif aa == wtaa:
-                nsyn += row[c]
-            else:
-                nnonsyn += row[c]
-            ntdiffs = ['{0}to{1}'.format(nt1, nt2) for (nt1, nt2) 
-                    in zip(wt, c) if nt1 != nt2]
-            nXnt[len(ntdiffs)] += row[c]
-            if len(ntdiffs) == 1:
-                nntchanges[ntdiffs[0]] += row[c]
-        nstoplist.append(nstop)
-        nsynlist.append(nsyn)
-        nnonsynlist.append(nnonsyn)
-        for n in range(3):
-            nXntlists[n + 1].append(nXnt[n + 1])
-        for ntchange in ntchanges:
-            nntchangeslists[ntchange].append(nntchanges[ntchange])
-    df = df.assign(nstop=nstoplist, nsyn=nsynlist, nnonsyn=nnonsynlist)
-    df = df.assign(n1nt=nXntlists[1], n2nt=nXntlists[2], n3nt=nXntlists[3])
-    for ntchange in ntchanges:
-        df[ntchange] = nntchangeslists[ntchange]
-
-    for nnt in range(3):
-        df['mutfreq{0}nt'.format(nnt + 1)] = (df['n{0}nt'.format(nnt + 1)]
-            / df['ncounts'].astype('float')).fillna(0)
+def _annotateCodonCountsChunk(codoncounts, wtindex):
+    """Computes the columns that `annotateCodonCounts` adds.
 
-    return df
+    Args:
+        `codoncounts` (`numpy.ndarray`)
+            Counts with a row per site and a column per codon
+            in `dms_tools2.CODONS`.
+        `wtindex` (`numpy.ndarray`)
+            Index in `dms_tools2.CODONS` of wildtype codon at each site.
+
+    Returns:
+        List of `(column, values)` 2-tuples for the columns in the
+        order that `annotateCodonCounts` adds them.
+    """
+    ncounts = codoncounts.sum(axis=1)
+    rows = numpy.arange(len(codoncounts))
+
+    def freq(n):
+        return numpy.divide(n, ncounts, out=numpy.zeros(len(codoncounts)),
+                where=(ncounts > 0))
+
+    mutfreq = freq(ncounts - codoncounts[rows, wtindex])
+
+    # counts of mutant codons: zero out counts for the wildtype codon
+    mutcounts = codoncounts.copy()
+    mutcounts[rows, wtindex] = 0
+
+    nstop = mutcounts[:, _CODON_ISSTOP].sum(axis=1)
+    nsyn = (mutcounts * ((_CODON_AAS[wtindex][:, None] == _CODON_AAS)
+            & ~_CODON_ISSTOP)).sum(axis=1)
+    nnonsyn = mutcounts.sum(axis=1) - nstop - nsyn
+    nXnt = _binRowSums(mutcounts, _NNT_DIFF[wtindex], 4)
+    # shift by one so codon pairs without a single change go in bin 0
+    nntchanges = _binRowSums(mutcounts, _NT_CHANGE_ID[wtindex] + 1,
+            len(_NTCHANGES) + 1)
+    return ([('ncounts', ncounts), ('mutfreq', mutfreq), ('nstop', nstop),
+                ('nsyn', nsyn), ('nnonsyn', nnonsyn)] +
+            [('n{0}nt'.format(n), nXnt[:, n]) for n in range(1, 4)] +
+            [(ntchange, nntchanges[:, i + 1])
+                for (i, ntchange) in enumerate(_NTCHANGES)] +
+            [('mutfreq{0}nt'.format(n), freq(nXnt[:, n]))
+                for n in range(1, 4)])
+
+
+def _binRowSums(values, bins, nbins):
+    """Sums the values in each row of an array by bin.
+
+    Args:
+        `values` (`numpy.ndarray`)
+            2D array of values.
+        `bins` (`numpy.ndarray`)
+            Integer array with same shape as `values` giving
+            the bin (0, 1, ..., `nbins - 1`) of each value.
+        `nbins` (int)
+            Number of bins.
+
+    Returns:
+        Array `sums` of shape `(len(values), nbins)` where `sums[i, j]`
+        is the sum of the elements in row `i` of `values` in bin `j`.
+
+    >>> values = numpy.array([[1, 2, 3], [4, 5, 6]])
+    >>> bins = numpy.array([[0, 1, 1], [2, 0, 2]])
+    >>> _binRowSums(values, bins, 3).tolist()
+    [[1, 5, 0], [5, 0, 10]]
+    """
+    nrows = len(values)
+    sums = numpy.bincount(
+            (bins + nbins * numpy.arange(nrows)[:, None]).ravel(),
+            weights=values.ravel(), minlength=nrows * nbins)
+    return sums.reshape(nrows, nbins).astype(values.dtype)
+
+
+def _mapRowChunks(func, arrays, nthreads):
+    """Applies function to chunks of rows of arrays using threads.
+
+    Args:
+        `func` (function)
+            Called as `func(*chunks)` on the corresponding row chunks
+            of each array in `arrays`.
+        `arrays` (list)
+            `numpy.ndarray` objects with the same number of rows.
+        `nthreads` (int)
+            Number of threads, and of row chunks. If 1, `func` is
+            just called on the full arrays.
+
+    Returns:
+        List of the results of `func` for each chunk, in row order.
+
+    >>> a = numpy.arange(10)
+    >>> [int(x) for x in _mapRowChunks(lambda x, y: (x + y).sum(),
+    ...         [a, a], 3)]
+    [12, 30, 48]
+    """
+    assert nthreads >= 1, "nthreads must be >= 1"
+    if nthreads == 1:
+        return [func(*arrays)]
+    chunks = zip(*[numpy.array_split(a, nthreads) for a in arrays])
+    with concurrent.futures.ThreadPoolExecutor(nthreads) as executor:
+        return list(executor.map(lambda chunk: func(*chunk), chunks))
 
 
 def adjustErrorCounts(errcounts, counts, charlist, maxexcess):
@@ -765,15 +1061,18 @@ def adjustErrorCounts(errcounts, counts, charlist, maxexcess):
     errcounts = errcounts.sort_values('site')
     assert all(counts['site'] == errcounts['site'])
     assert all(counts['wildtype'] == errcounts['wildtype'])
-    counts['total'] = counts[charlist].sum(axis=1).astype('float')
-    errcounts['total'] = errcounts[charlist].sum(axis=1)
-    maxallowed = (counts[charlist].div(counts['total'], axis=0).multiply(
-            errcounts['total'], axis=0) + maxexcess).round().astype('int')
-    adj_errcounts = errcounts[charlist].where(errcounts[charlist] < maxallowed, 
-            maxallowed[charlist])
-    for c in charlist:
-        adj_errcounts[c] = adj_errcounts[c].where(counts['wildtype'] != c,
-                errcounts[c])
+    c = counts[charlist].values
+    e = errcounts[charlist].values
+    total = c.sum(axis=1).astype('float')
+    if (total == 0).any():
+        raise ValueError("sites with no counts in `counts`")
+    maxallowed = numpy.round(c / total[:, None] * e.sum(axis=1)[:, None]
+            + maxexcess).astype('int')
+    iswt = (pandas.Categorical(counts['wildtype'], charlist).codes[:, None]
+            == numpy.arange(len(charlist)))
+    adj_errcounts = pandas.DataFrame(
+            numpy.where(iswt, e, numpy.minimum(e, maxallowed)),
+            columns=charlist, index=errcounts.index)
     for col in cols:
         if col not in charlist:
             adj_errcounts[col] = counts[col]
@@ -807,10 +1106,11 @@ def convertCountsFormat(oldfile, newfile, charlist):
 
 
 def renumberSites(renumbfile, infiles, missing='error',
-        outfiles=None, outprefix=None, outdir=None):
+        outfiles=None, outprefix=None, outdir=None, ncpus=1):
     """Renumber sites in CSV files.
 
     Switch numbering scheme in files with a column named `site`. 
+    All other columns are copied exactly as they appear in the file.
 
     You must specify **exactly one** of `outfiles`,
     `outprefix`, and `outdir` as something other than `None`.
@@ -823,10 +1123,14 @@ def renumberSites(renumbfile, infiles, missing='error',
             the input files, and each entry in `new` should be
             the new number for this site. If an entry in `new`
             is `None` or `nan` then it is dropped from the newly
-            numbered files regardless of `missing`.
+            numbered files regardless of `missing`. If every
+            entry in `new` equals `original` and `missing` is
+            `skip`, files that renumbering would not change are
+            just copied.
         `infiles` (list)
             List of existing CSV files that we are re-numbering.
-            Each file must have an entry of `site`.
+            Each file must have an entry of `site`. Rows with a
+            `site` that is empty, `None`, or `nan` are dropped.
         `missing` (str)
             How to handle sites in `infiles` but not `renumbfile`.
                 - `error`: raise an error
@@ -843,19 +1147,20 @@ def renumberSites(renumbfile, infiles, missing='error',
             The renumbered files have the same names and locations
             as `infiles`, but have the pre-pended filename extension
             `outprefix`.
+        `ncpus` (int)
+            Number of processes used to renumber the files in
+            parallel. Use -1 for all available CPUs.
     """
     assert os.path.isfile(renumbfile), "no renumbfile {0}".format(renumbfile)
-    renumb = pandas.read_csv(renumbfile)
-    assert {'original', 'new'} <=  set(renumb.columns), \
-            "renumbfile lacks columns `original` and/or `new`"
-    for col in ['original', 'new']:
-        assert len(renumb[col]) == len(set(renumb[col])), \
-                "duplicate sites for {0} in {1}".format(col, renumbfile)
-        renumb[col] = renumb[col].astype('str')
+    renumbstat = os.stat(renumbfile)
+    replacemap = _readRenumbFile(os.path.abspath(renumbfile),
+            renumbstat.st_mtime_ns, renumbstat.st_size)
 
     assert isinstance(infiles, list), "infiles is not a list"
     nin = len(infiles)
-    infiles = [os.path.abspath(f) for f in infiles]
+    # like `os.path.abspath` without calling `os.getcwd` for every file
+    cwd = os.getcwd()
+    infiles = [os.path.normpath(os.path.join(cwd, f)) for f in infiles]
     assert len(set(infiles)) == nin, "duplicate files in `infiles`"
     
     if outfiles is not None:
@@ -884,41 +1189,235 @@ def renumberSites(renumbfile, infiles, missing='error',
     else:
         raise ValueError("specify `outdir`, `outprefix`, `outfiles`")
 
-    outfiles = [os.path.abspath(f) for f in outfiles]
-    assert len(set(outfiles)) == len(outfiles), "duplicate files in `outfiles`"
-    assert not set(outfiles).intersection(set(infiles)), \
-            "some in and outfiles the same"
-
-    for (fin, fout) in zip(infiles, outfiles):
-        df_in = pandas.read_csv(fin)
-        assert 'site' in df_in.columns, "no `site` column in {0}".format(fin)
-        df_in['site'] = df_in['site'].astype('str')
-        if missing == 'error':
-            if set(df_in['site']) > set(renumb['original']):
-                raise ValueError("`missing` is `error`, excess sites in {0}"
-                    .format(fin))
-        elif missing == 'skip':
-            pass
-        elif missing == 'drop':
-            df_in = df_in[df_in['site'].isin(renumb['original'])]
+    outfiles = [os.path.normpath(os.path.join(cwd, f)) for f in outfiles]
+    assert len(set(infiles + outfiles)) == 2 * nin, \
+            "duplicate files in `outfiles` or some in and outfiles the same"
+
+    if missing not in {'error', 'skip', 'drop'}:
+        raise ValueError("invalid `missing` of {0}".format(missing))
+    if ncpus == -1:
+        ncpus = os.cpu_count()
+    assert ncpus >= 1, "ncpus must be >= 1 or -1"
+
+    # new number (or `None` to drop) for each site, shared by all files
+    # so each site that is not in `renumbfile` is resolved only once.
+    # Blank records have a site of '', so are dropped by same lookup.
+    newsites = dict.fromkeys(_DROPPED_SITES)
+    newsites.update(replacemap)
+    quotesafe = not any(set(site or '') & set(',"\r\n')
+            for site in replacemap.values())
+    # if renumbering changes no site, files without dropped rows are copied
+    identity = (missing == 'skip') and all(site == newsite
+            for (site, newsite) in replacemap.items())
+
+    if ncpus == 1 or nin < 2:
+        for (i, (fin, fout)) in enumerate(zip(infiles, outfiles)):
+            if i + 1 < nin:
+                _prefetchFile(infiles[i + 1])
+            _renumberSitesFile(fin, fout, newsites, quotesafe, missing,
+                    identity)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(min(ncpus, nin)
+                ) as executor:
+            futures = [executor.submit(_renumberSitesFile, fin, fout,
+                    newsites, quotesafe, missing, identity)
+                    for (fin, fout) in zip(infiles, outfiles)]
+            for future in futures:
+                future.result()
+
+
+@functools.lru_cache(maxsize=16)
+def _readRenumbFile(renumbfile, mtime, size):
+    """Reads renumbering file for `renumberSites`.
+
+    `renumberSites` is often called repeatedly with the same file, so
+    results are cached. The cache is keyed on the modification time
+    and size as well as the name so that edits to the file are seen.
+
+    Args:
+        `renumbfile` (str)
+            Absolute path of renumbering file.
+        `mtime` (int)
+            Modification time of `renumbfile` in nanoseconds.
+        `size` (int)
+            Size of `renumbfile` in bytes.
+
+    Returns:
+        Dict mapping each site in `original` column to its new
+        number, or to `None` if it is dropped. Do not modify it, as
+        the same dict is returned for each call with the same file.
+    """
+    renumb = pandas.read_csv(renumbfile, dtype=str)
+    assert {'original', 'new'} <=  set(renumb.columns), \
+            "renumbfile lacks columns `original` and/or `new`"
+    dropped = renumb['new'].isnull() | renumb['new'].isin(_DROPPED_SITES)
+    for (col, sites) in [('original', renumb['original'].dropna()),
+                         ('new', renumb['new'][~dropped])]:
+        assert not sites.duplicated().any(), \
+                "duplicate sites for {0} in {1}".format(col, renumbfile)
+    return dict(zip(renumb['original'].values,
+            numpy.where(dropped.values, None, renumb['new'].values)))
+
+
+def _renumberSitesFile(fin, fout, newsites, quotesafe, missing,
+        identity=False):
+    """Renumbers sites in one file for `renumberSites`.
+
+    The file is processed as text rather than parsed into a data
+    frame, so all columns other than `site` are written as read.
+
+    Args:
+        `fin` (str)
+            Existing CSV file with a `site` column.
+        `fout` (str)
+            Created CSV file with the renumbered sites.
+        `newsites` (dict)
+            Maps sites to their new number, or to `None` if they are
+            dropped. Sites not in it are resolved according to
+            `missing`, and added to it.
+        `quotesafe` (bool)
+            Can all new sites be written to CSV without quoting?
+        `missing` (str)
+            Same meaning as for `renumberSites`.
+        `identity` (bool)
+            Does renumbering leave every site unchanged? If so, and
+            rewriting `fin` would not change any of its lines, `fin`
+            is just copied to `fout`.
+    """
+    with open(fin, newline='', buffering=_RENUMBER_BUFSIZE) as f:
+        header = next(csv.reader(f), [])
+        assert 'site' in header, "no `site` column in {0}".format(fin)
+        isite = header.index('site')
+
+        if identity:
+            # copy only if output would be the same bytes as rewriting
+            f.seek(0)
+            if all(_unchangedByRenumbering(line, isite, newsites)
+                    for line in f):
+                shutil.copyfile(fin, fout)
+                return
+            f.seek(0)
+            next(csv.reader(f))
+
+        # if `site` is first field and the new sites need no quoting, each
+        # record is just split at its first comma instead of fully parsed
+        splitfirst = (isite == 0) and quotesafe
+
+        excesssite = False
+        with open(fout, 'w', newline='', buffering=_RENUMBER_BUFSIZE
+                ) as fo:
+            writer = csv.writer(fo, lineterminator='\n')
+            writer.writerow(header)
+            for record in _csvRecords(f):
+                if isinstance(record, list):
+                    row = record
+                    site = row[isite]
+                elif splitfirst:
+                    (site, comma, rest) = record.partition(',')
+                    row = None
+                elif record:
+                    row = record.split(',')
+                    site = row[isite]
+                else:
+                    continue
+                try:
+                    newsite = newsites[site]
+                except KeyError:
+                    if missing == 'error':
+                        excesssite = True
+                        break
+                    elif missing == 'drop':
+                        newsite = newsites[site] = None
+                    else:
+                        newsite = newsites[site] = site
+                if newsite is None:
+                    continue
+                elif row is None:
+                    fo.write(newsite + comma + rest + '\n')
+                else:
+                    row[isite] = newsite
+                    writer.writerow(row)
+
+    if excesssite:
+        os.remove(fout)
+        raise ValueError("`missing` is `error`, excess sites in {0}"
+                .format(fin))
+
+
+def _unchangedByRenumbering(line, isite, newsites):
+    """Is line written unchanged by `_renumberSitesFile`?
+
+    Args:
+        `line` (str)
+            Line of CSV file, including its line ending.
+        `isite` (int)
+            Index of `site` field.
+        `newsites` (dict)
+            Maps sites to new numbers as for `_renumberSitesFile`,
+            which are assumed to leave all sites unchanged.
+
+    Returns:
+        `True` if `line` has no quotes and a ``\\n`` line ending,
+        and its site is not dropped; otherwise `False`.
+
+    >>> newsites = {'': None, 'nan': None}
+    >>> [_unchangedByRenumbering(line, 0, newsites) for line in
+    ...         ['1,A\\n', 'nan,B\\n', '\\n', '1,A\\r\\n', '1,"A"\\n', '1,A']]
+    [True, False, False, False, False, False]
+    """
+    if ('"' in line) or (line[-1 : ] != '\n') or (line[-2 : ] == '\r\n'):
+        return False
+    fields = line[ : -1].split(',')
+    return len(fields) > isite and newsites.get(fields[isite], '') is not None
+
+
+def _prefetchFile(filename):
+    """Asks the operating system to start reading a file into memory.
+
+    The read happens in the background, so the file can be loaded
+    from disk while other work is done. Does nothing if the platform
+    lacks `os.posix_fadvise` or the file cannot be opened.
+
+    Args:
+        `filename` (str)
+            Name of file to prefetch.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(filename, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+def _csvRecords(f):
+    """Iterates over records in a CSV file, parsing only quoted ones.
+
+    Args:
+        `f` (file-like object)
+            CSV file opened in text mode with `newline=''`.
+
+    Returns:
+        Iterator over each record. A record on a line without quotes
+        is returned as a str without the trailing line ending. Any
+        other record is parsed by `csv.reader` (which decides where
+        it ends, as quoted fields can contain line breaks) and is
+        returned as a list of fields.
+
+    >>> f = io.StringIO('a,b\\r\\n"c\\nd",e\\n\\nf,5"\\ng,h')
+    >>> list(_csvRecords(f))
+    ['a,b', ['c\\nd', 'e'], '', ['f', '5"'], 'g,h']
+    """
+    for line in f:
+        if '"' in line:
+            # `csv.reader` only takes as many lines as the record spans
+            yield next(csv.reader(itertools.chain([line], f)))
         else:
-            raise ValueError("invalid `missing` of {0}".format(missing))
-
-        # can't just use replace below because of this bug:
-        # https://github.com/pandas-dev/pandas/issues/16051
-        unmappedsites = df_in[~df_in['site'].isin(renumb['original'])]['site']
-        replacemap = dict(zip(
-                renumb['original'].append(unmappedsites),
-                renumb['new'].append(unmappedsites)))
-        df_in['site'] = df_in['site'].map(replacemap)
-
-        df_in = (df_in[df_in['site'].notnull()]
-                      .query('site != "NaN"')
-                      .query('site != "nan"')
-                      .query('site != "None"')
-                      )
-
-        df_in.to_csv(fout, index=False)
+            yield line.rstrip('\r\n')
 
 
 if __name__ == '__main__':
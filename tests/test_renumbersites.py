@@ -48,6 +48,14 @@ class test_renumberSites(unittest.TestCase):
                     '2,B',
                     ]))
 
+        infile3 = os.path.join(testdir, 'file3.csv')
+        with open(infile3, 'w') as f:
+            f.write('\n'.join([
+                    'site,val',
+                    '1,A',
+                    '5,E',
+                    ]))
+
         outdir = os.path.join(testdir, 'outdir')
         outfiles = [os.path.join(outdir, 'file1.csv'),
                     os.path.join(outdir, 'file2.csv')]
@@ -58,6 +66,9 @@ class test_renumberSites(unittest.TestCase):
         with self.assertRaises(ValueError):
             renumberSites(renumbfile, [infile1, infile2],
                     missing='error', outdir=outdir)
+        with self.assertRaises(ValueError):
+            renumberSites(renumbfile, [infile2, infile3],
+                    missing='error', outdir=outdir)
 
         renumberSites(renumbfile, [infile1, infile2],
                 missing='skip', outdir=outdir)
@@ -82,6 +93,118 @@ class test_renumberSites(unittest.TestCase):
         self.assertTrue(all(df2['site'] == ['3', '3a', '3a']))
         self.assertTrue(all(df2['val'] == ['A', 'B', 'B']))
 
+    def test_renumberSites_csvformats(self):
+        """Tests `renumberSites` on quoted, CRLF, and reordered files."""
+        testdir = os.path.join(os.path.dirname(__file__),
+                'test_renumbersites_files')
+        if not os.path.isdir(testdir):
+            os.mkdir(testdir)
+
+        # blank `new` entry used to make `new` a float column
+        renumbfile = os.path.join(testdir, 'formats_renumbfile.csv')
+        with open(renumbfile, 'w') as f:
+            f.write('original,new\n1,3\n2,\n3,4\n')
+
+        infiles = [os.path.join(testdir, 'formats_file1.csv'),
+                   os.path.join(testdir, 'formats_file2.csv')]
+        # `site` not first column, quoted commas and newlines, CRLF
+        with open(infiles[0], 'w', newline='') as f:
+            f.write('val,site,note\r\n'
+                    '"x,y",1,"multi\nline"\r\n'
+                    'B,2,plain\r\n'
+                    'C,3,"q""z"\r\n')
+        # `site` first column, quoted commas and newlines, CRLF
+        with open(infiles[1], 'w', newline='') as f:
+            f.write('site,val\r\n'
+                    '1,"a,b"\r\n'
+                    '2,c\r\n'
+                    '3,"d\ne"\r\n')
+
+        outputs = {}
+        for ncpus in [1, 2]:
+            outdir = os.path.join(testdir, 'formats_outdir{0}'.format(ncpus))
+            renumberSites(renumbfile, infiles, missing='error',
+                    outdir=outdir, ncpus=ncpus)
+            outfiles = [os.path.join(outdir, os.path.basename(f))
+                    for f in infiles]
+            outputs[ncpus] = []
+            for fout in outfiles:
+                with open(fout, newline='') as f:
+                    text = f.read()
+                self.assertNotIn('\r', text)
+                self.assertNotIn('3.0', text)
+                outputs[ncpus].append(text)
+            df1 = pandas.read_csv(outfiles[0], dtype=str)
+            self.assertEqual(list(df1['site']), ['3', '4'])
+            self.assertEqual(list(df1['val']), ['x,y', 'C'])
+            self.assertEqual(list(df1['note']), ['multi\nline', 'q"z'])
+            df2 = pandas.read_csv(outfiles[1], dtype=str)
+            self.assertEqual(list(df2['site']), ['3', '4'])
+            self.assertEqual(list(df2['val']), ['a,b', 'd\ne'])
+            for fout in outfiles:
+                os.remove(fout)
+        self.assertEqual(outputs[1], outputs[2])
+
+        # a stray quote inside an unquoted field does not start a
+        # quoted field, so must not join the following lines
+        strayfiles = [os.path.join(testdir, 'formats_stray1.csv'),
+                      os.path.join(testdir, 'formats_stray2.csv')]
+        with open(strayfiles[0], 'w') as f:
+            f.write('site,note\n1,5"\n3,x\n')
+        with open(strayfiles[1], 'w') as f:
+            f.write('note,site\n5",1\nx,3\n')
+        outdir = os.path.join(testdir, 'formats_strayoutdir')
+        renumberSites(renumbfile, strayfiles, missing='error',
+                outdir=outdir)
+        for f in strayfiles:
+            fout = os.path.join(outdir, os.path.basename(f))
+            df = pandas.read_csv(fout, dtype=str)
+            self.assertEqual(list(df['site']), ['3', '4'])
+            self.assertEqual(list(df['note']), ['5"', 'x'])
+            os.remove(fout)
+
+        # `missing='error'` does not leave a partial output file
+        infile = os.path.join(testdir, 'formats_file3.csv')
+        with open(infile, 'w') as f:
+            f.write('site,val\n1,A\n5,E\n')
+        outfile = os.path.join(testdir, 'formats_out3.csv')
+        with self.assertRaises(ValueError):
+            renumberSites(renumbfile, [infile], missing='error',
+                    outfiles=[outfile])
+        self.assertFalse(os.path.isfile(outfile))
+
+    def test_renumberSites_identity(self):
+        """Identity renumbering gives same output as other renumbering."""
+        testdir = os.path.join(os.path.dirname(__file__),
+                'test_renumbersites_files')
+        if not os.path.isdir(testdir):
+            os.mkdir(testdir)
+
+        renumbfile = os.path.join(testdir, 'identity_renumbfile.csv')
+        with open(renumbfile, 'w') as f:
+            f.write('original,new\n1,1\n2,2\n3,3\n')
+        infiles = [os.path.join(testdir, 'identity_file1.csv'),
+                   os.path.join(testdir, 'identity_file2.csv'),
+                   os.path.join(testdir, 'identity_file3.csv')]
+        with open(infiles[0], 'w') as f:
+            f.write('site,val\n1,A\n2,B\n,C\nnan,D\n3,E\n')
+        with open(infiles[1], 'w') as f:
+            f.write('site,val\n1,A\n2,B\n3,E\n')
+        with open(infiles[2], 'w', newline='') as f:
+            f.write('site,val\r\n1,A\r\n2,B\r\n3,E\r\n')
+        outdir = os.path.join(testdir, 'identity_outdir')
+
+        for missing in ['skip', 'error']:
+            for ncpus in [1, 2]:
+                renumberSites(renumbfile, infiles, missing=missing,
+                        ncpus=ncpus, outdir=outdir)
+                for f in infiles:
+                    fout = os.path.join(outdir, os.path.basename(f))
+                    with open(fout, newline='') as fo:
+                        self.assertEqual(fo.read(),
+                                'site,val\n1,A\n2,B\n3,E\n')
+                    os.remove(fout)
+
 
 if __name__ == '__main__':
     runner = unittest.TextTestRunner()